@@ -16,6 +16,9 @@ import traceback
 
 from .fusion_data_api_id_utils import get_fusion_data_ids_for_active_document, get_fusion_data_ids_for_component
 
+# Configuration Options
+PRETTY_PRINT_OUTPUT = False
+
 app = adsk.core.Application.get()
 ui = app.userInterface
 
@@ -23,31 +26,32 @@ ui = app.userInterface
 # Print results to text command palette
 def run(context):
     try:
-        break_string = '************* Assembly Data *************\n'
-        app.log(break_string, adsk.core.LogLevels.InfoLogLevel, adsk.core.LogTypes.ConsoleLogType)
-
-        results = get_fusion_data_ids_for_active_document()
-        output_string = json.dumps(results, indent=4)
-        app.log(output_string, adsk.core.LogLevels.InfoLogLevel, adsk.core.LogTypes.ConsoleLogType)
-
-        adsk.doEvents()
-
-        break_string = '\n\n************* Component Data *************\n'
-        app.log(break_string, adsk.core.LogLevels.InfoLogLevel, adsk.core.LogTypes.ConsoleLogType)
-
-        selection = ui.selectEntity('Pick a Component', 'Occurrences,RootComponents')
-        if selection.entity.objectType == adsk.fusion.Component.classType():
-            component = adsk.fusion.Component.cast(selection.entity)
-        elif selection.entity.objectType == adsk.fusion.Occurrence.classType():
-            occurrence = adsk.fusion.Occurrence.cast(selection.entity)
-            component = occurrence.component
-        else:
-            raise TypeError('Selection Type was invalid')
-
-        results = get_fusion_data_ids_for_component(component)
-        output_string = json.dumps(results, indent=4)
-        app.log(output_string, adsk.core.LogLevels.InfoLogLevel, adsk.core.LogTypes.ConsoleLogType)
+        design_results = get_fusion_data_ids_for_active_document()
+        output_string = f'************* Assembly Data *************\n{_format_results(design_results)}'
+
+        # Log everything in one call, the assembly data is still logged if the selection is cancelled or invalid
+        try:
+            adsk.doEvents()
+            selection = ui.selectEntity('Pick a Component', 'Occurrences,RootComponents')
+            if selection.entity.objectType == adsk.fusion.Component.classType():
+                component = adsk.fusion.Component.cast(selection.entity)
+            elif selection.entity.objectType == adsk.fusion.Occurrence.classType():
+                occurrence = adsk.fusion.Occurrence.cast(selection.entity)
+                component = occurrence.component
+            else:
+                raise TypeError('Selection Type was invalid')
+
+            component_results = get_fusion_data_ids_for_component(component)
+            output_string += f'\n\n************* Component Data *************\n{_format_results(component_results)}'
+        finally:
+            app.log(output_string, adsk.core.LogLevels.InfoLogLevel, adsk.core.LogTypes.ConsoleLogType)
 
     except:
         if ui:
             ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+
+
+def _format_results(results) -> str:
+    if PRETTY_PRINT_OUTPUT:
+        return json.dumps(results, indent=4)
+    return json.dumps(results, separators=(',', ':'))
@@ -8,12 +8,19 @@
 #   AUTODESK, INC. DOES NOT WARRANT THAT THE OPERATION OF THE PROGRAM WILL BE
 #   UNINTERRUPTED OR ERROR FREE.
 import base64
+import functools
 import json
 import os
-from typing import TypedDict
+from typing import Optional, TypedDict, Union
 import adsk.core
 import adsk.fusion
 
+# Optional faster json parser/serializer, falls back to the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configuration Options
 CACHE_RESULTS = True
 BASE_FOLDER_NAME = 'FusionDataUtils'
@@ -25,7 +32,10 @@ ui = app.userInterface
 base_folder = os.path.join(os.path.expanduser('~'), BASE_FOLDER_NAME)
 json_output_folder = os.path.join(base_folder, JSON_OUTPUT_FOLDER_NAME, '')
 results = {}
-collection_id = app.data.activeSpaceCollectionId
+# Lookup of version_id -> {f3dComponentId: ComponentInfo}, not written to the file cache
+_component_index = {}
+# version_ids changed since the file cache was last written
+_dirty = set()
 
 # Initial folder creation for file cache
 if CACHE_RESULTS:
@@ -68,9 +78,7 @@ def get_fusion_data_ids_for_component(component: adsk.fusion.Component) -> Compo
         return component_result
 
     # Try to compute IDs for active design
-    _generate_design_info(component_parent_design)
-
-    component_result = _get_component_info_from_results_global(version_id, component)
+    component_result = _generate_design_info(component_parent_design, target_component=component)
     if component_result is not None:
         return component_result
 
@@ -97,59 +105,124 @@ def get_fusion_data_ids_for_design(design: adsk.fusion.Design) -> DesignInfo:
     design_version_id = design_data_file.versionId
 
     # If results already exist return them
-    mem_cache_design_version = results.get(design_version_id, None)
+    mem_cache_design_version = results.get(design_version_id)
     if mem_cache_design_version is not None:
         _refresh_design_info_result(design_version_id, mem_cache_design_version, design_data_file)
-        return results[design_version_id]
+        return mem_cache_design_version
 
     # Try to compute IDs for active design
     _generate_design_info(design)
 
     # If results now exist return them
-    if results.get(design_version_id, False):
-        return results[design_version_id]
+    design_info = results.get(design_version_id)
+    if design_info is not None:
+        return design_info
 
     # Raise an error if IDs could not be computed
     raise RuntimeError(f"Could not get Fusion Data API IDs for: {design.parentDocument.name}")
 
 
 # Get relevant PIM data for design
-def _generate_design_info(design):
-    global collection_id
-
+# If target_component is given its ComponentInfo is returned, or None if it has none
+def _generate_design_info(
+        design: adsk.fusion.Design, target_component: Optional[adsk.fusion.Component] = None
+) -> Optional[ComponentInfo]:
     design_data_file = design.parentDocument.dataFile
     design_version_id = design_data_file.versionId
 
     if CACHE_RESULTS:
-        disk_cache_design_version: DesignInfo = _read_versions_file(design_version_id)
+        disk_cache_design_version: Optional[DesignInfo] = _read_versions_file(design_version_id)
         if disk_cache_design_version is not None:
             _refresh_design_info_result(design_version_id, disk_cache_design_version, design_data_file)
-            return
+            return _get_target_component_info(design_version_id, target_component)
 
     collection_id = app.data.activeSpaceCollectionId
     _ensure_file_version_in_results(design_data_file)
     structured_pim_data = _make_structured_pim_data(design)
-    _generate_component_info_for_design(design_version_id, design, structured_pim_data)
+    _generate_component_info_for_design(design_version_id, design, structured_pim_data, collection_id)
 
     if CACHE_RESULTS:
         _write_results()
+    else:
+        # Nothing will be written, so don't let the set grow for the whole session
+        _dirty.clear()
 
+    return _get_target_component_info(design_version_id, target_component)
+
+
+def _get_target_component_info(
+        design_version_id: str, target_component: Optional[adsk.fusion.Component]
+) -> Optional[ComponentInfo]:
+    if target_component is not None:
+        return _get_component_info_from_results_global(design_version_id, target_component)
+    return None
 
-# Get relevant PIM data (Fusion Data API IDs) for Components in design
-def _generate_component_info_for_design(design_version_id: str, design: adsk.fusion.Design, pim_data: dict):
-    for component in design.allComponents:
-        component_data_file = component.parentDesign.parentDocument.dataFile
-        component_lineage_id = component_data_file.id
-        component_version_id = component_data_file.versionId
 
-        _ensure_file_version_in_results(component_data_file)
+# Get relevant PIM data (Fusion Data API IDs) for Components in design
+def _generate_component_info_for_design(
+        design_version_id: str, design: adsk.fusion.Design, pim_data: dict, collection_id: str
+):
+    collection_id_prefix = f'comp~{collection_id}~'
+
+    # Read everything from Fusion first, then only touch python objects while updating results
+    component_snapshot, new_design_infos = _snapshot_components(design)
+    for design_info in new_design_infos.values():
+        _add_design_info_to_results(design_info)
+
+    # Bind module state to locals for the per component loop
+    design_results = results
+    component_index = _component_index
+    dirty = _dirty
+    all_components = design_results[design_version_id]['AllComponents']
+
+    for name, f3d_component_id, component_lineage_id, component_version_id in component_snapshot:
         pim_data_for_component_parent_file: dict = pim_data.get(component_lineage_id)
 
         if pim_data_for_component_parent_file:
             # Get Component and ComponentVersion IDs and commit result
-            component_info = _make_component_info(component, pim_data_for_component_parent_file)
-            results[component_version_id]['Components'].append(component_info)
-            results[design_version_id]['AllComponents'].append(component_info)
+            component_info = _make_component_info(
+                name, f3d_component_id, pim_data_for_component_parent_file, collection_id_prefix
+            )
+            design_results[component_version_id]['Components'].append(component_info)
+            component_index[component_version_id][f3d_component_id] = component_info
+            all_components.append(component_info)
+            dirty.add(component_version_id)
+
+    dirty.add(design_version_id)
+
+
+# Read everything needed from design.allComponents in one walk
+# Returns (name, f3dComponentId, lineage_id, version_id) per component as plain python strings
+# and a DesignInfo for each parent file version that is not in results yet
+def _snapshot_components(
+        design: adsk.fusion.Design
+) -> tuple[list[tuple[str, str, str, str]], dict[str, DesignInfo]]:
+    snapshot = []
+    new_design_infos: dict[str, DesignInfo] = {}
+
+    # Parent design of the previous component and its (lineage_id, version_id)
+    # Fusion returns a new wrapper object on each property access, so compare with == rather than id()
+    # Each == is a native call too, so only the last parent is checked, costing one extra call per change of file
+    last_parent_design = None
+    last_ids = None
+
+    all_components = design.allComponents
+    for component in all_components:
+        component_parent_design = component.parentDesign
+        if last_parent_design is not None and last_parent_design == component_parent_design:
+            component_lineage_id, component_version_id = last_ids
+        else:
+            component_data_file = component_parent_design.parentDocument.dataFile
+            component_lineage_id = component_data_file.id
+            component_version_id = component_data_file.versionId
+            if component_version_id not in results and component_version_id not in new_design_infos:
+                new_design_infos[component_version_id] = _make_design_info(component_data_file)
+            last_parent_design = component_parent_design
+            last_ids = (component_lineage_id, component_version_id)
+
+        snapshot.append((component.name, component.id, component_lineage_id, component_version_id))
+
+    return snapshot, new_design_infos
 
 
 # Create a map of component.id to Space/Assets
@@ -160,34 +233,46 @@ def _make_structured_pim_data(design: adsk.fusion.Design) -> dict:
 
     # This is an undocumented API to get the PIM data for the active document.
     raw_pim_data_string = design.parentDocument.dataFile.assemblyPIMData()
-    raw_pim_data: dict = json.loads(raw_pim_data_string)
+    raw_pim_data: dict = _load_json(raw_pim_data_string)
 
-    for space_id, space in raw_pim_data.items():
-        if isinstance(space, dict):
-            model_asset: dict = space.get('modelAsset')
-            if model_asset:
-                f3d_component_id = model_asset['attributes']['f3dComponentId']['value']
-                component_wip_lineage_id = model_asset['attributes']['wipLineageUrn']['value']
+    for space in raw_pim_data.values():
+        # Most values are component spaces, so skip anything else by catching the failed lookup
+        # rather than type checking every entry
+        try:
+            attributes: dict = space['modelAsset']['attributes']
+            f3d_component_id = attributes['f3dComponentId']['value']
+            component_wip_lineage_id = attributes['wipLineageUrn']['value']
+        except (TypeError, KeyError):
+            continue
 
-                if not pim_data.get(component_wip_lineage_id):
-                    pim_data[component_wip_lineage_id] = {}
-                pim_data[component_wip_lineage_id][f3d_component_id] = space
+        pim_data.setdefault(component_wip_lineage_id, {})[f3d_component_id] = space
 
     return pim_data
 
 
 def _ensure_file_version_in_results(data_file: adsk.core.DataFile):
-    version_id = data_file.versionId
-    if not results.get(version_id):
-        results[version_id] = _make_design_info(data_file)
+    if data_file.versionId not in results:
+        _add_design_info_to_results(_make_design_info(data_file))
+
 
+def _add_design_info_to_results(design_info: DesignInfo):
+    version_id = design_info['DesignFileVersionId']
+    results[version_id] = design_info
+    _component_index[version_id] = {}
+    _dirty.add(version_id)
 
-def _make_component_info(component, pim_data_for_component_parent_file) -> ComponentInfo:
+
+def _make_component_info(
+        name: str, f3d_component_id: str, pim_data_for_component_parent_file: dict, collection_id_prefix: str
+) -> ComponentInfo:
+    component_id, component_version_id = _make_component_and_version_ids(
+        f3d_component_id, pim_data_for_component_parent_file, collection_id_prefix
+    )
     return{
-        'Name': component.name,
-        'f3dComponentId': component.id,
-        'ComponentId': _make_fusion_data_component_id(component, pim_data_for_component_parent_file),
-        'ComponentVersionId': _make_fusion_data_component_version_id(component, pim_data_for_component_parent_file),
+        'Name': name,
+        'f3dComponentId': f3d_component_id,
+        'ComponentId': component_id,
+        'ComponentVersionId': component_version_id,
     }
 
 
@@ -214,63 +299,79 @@ def _get_fresh_file_data_properties(data_file: adsk.core.DataFile) -> dict:
 
 def _refresh_design_info_result(version_id: str, design_version_info: DesignInfo, data_file: adsk.core.DataFile):
     fresh_file_data = _get_fresh_file_data_properties(data_file)
-    design_version_info.update(fresh_file_data)
-    results[version_id] = design_version_info
-    _write_one_json_object(design_version_info, version_id)
+    changed = any(design_version_info.get(key) != value for key, value in fresh_file_data.items())
+    if changed:
+        design_version_info.update(fresh_file_data)
+
+    # Only newly loaded objects need to be put in results and indexed
+    if results.get(version_id) is not design_version_info:
+        results[version_id] = design_version_info
+        _share_component_infos(design_version_info)
+        _index_components(version_id, design_version_info)
+
+    if changed and CACHE_RESULTS:
+        _write_one_json_object(design_version_info, version_id)
 
 
-def _get_component_info_from_results_global(version_id: str, component: adsk.fusion.Component) -> ComponentInfo:
-    if results.get(version_id, False):
-        component_list = results[version_id]['Components']
-        component_match = [_component for _component in component_list if _component['f3dComponentId'] == component.id]
-        if len(component_match) > 0:
-            return component_match[0]
+# The file cache stores a component in both Components and AllComponents
+# Point AllComponents back at the matching Components entries so loaded designs hold one copy, like generated ones do
+def _share_component_infos(design_version_info: DesignInfo):
+    components_by_value = {
+        tuple(component_info.values()): component_info for component_info in design_version_info['Components']
+    }
+    design_version_info['AllComponents'] = [
+        components_by_value.get(tuple(component_info.values()), component_info)
+        for component_info in design_version_info['AllComponents']
+    ]
+
+
+def _index_components(version_id: str, design_version_info: DesignInfo):
+    _component_index[version_id] = {
+        component_info['f3dComponentId']: component_info for component_info in design_version_info['Components']
+    }
+
+
+def _get_component_info_from_results_global(
+        version_id: str, component: adsk.fusion.Component
+) -> Optional[ComponentInfo]:
+    return _component_index.get(version_id, {}).get(component.id)
 
 
 # Does URL safe substitution within python builtin alphabet support
+@functools.lru_cache(maxsize=4096)
 def _make_url_safe_base64_encoded_string(string: str) -> str:
-    string_bytes = string.encode("ascii")
-    base64_bytes = base64.urlsafe_b64encode(string_bytes)
-    base64_string = base64_bytes.decode("ascii")
-
-    # Strip the trailing pad characters
-    base64_string = base64_string.rstrip("=")
-    return base64_string
+    # Strip the trailing pad characters before decoding
+    return base64.urlsafe_b64encode(string.encode("ascii")).rstrip(b"=").decode("ascii")
 
 
 def _get_asset_id(space: dict) -> str:
-    model_asset: dict = space.get('modelAsset', False)
+    model_asset: dict = space.get('modelAsset')
     if model_asset:
         return model_asset['id']
     return ''
 
 
 def _get_snapshot_id(space: dict) -> str:
-    snapshot_id: str = space.get('snapshotId', False)
-    if snapshot_id:
-        return snapshot_id
-    return ''
-
-
-def _make_fusion_data_component_id(component: adsk.fusion.Component, pim_data: dict) -> str:
-    space: dict = pim_data.get(component.id, None)
-    if space:
-        pim_model_asset_id = _get_asset_id(space)
-        fusion_data_component_id = f'comp~{collection_id}~{pim_model_asset_id}~~'
-        return _make_url_safe_base64_encoded_string(fusion_data_component_id)
-
-    return "Failed to get ID"
+    return space.get('snapshotId') or ''
 
 
-def _make_fusion_data_component_version_id(component: adsk.fusion.Component, pim_data: dict) -> str:
-    space: dict = pim_data.get(component.id, None)
+# Returns the Fusion Data API (ComponentId, ComponentVersionId) for a component
+def _make_component_and_version_ids(
+        f3d_component_id: str, pim_data: dict, collection_id_prefix: str
+) -> tuple[str, str]:
+    space: dict = pim_data.get(f3d_component_id, None)
     if space:
         pim_model_asset_id = _get_asset_id(space)
         pim_snapshot_id = _get_snapshot_id(space)
-        fusion_data_component_version_id = f'comp~{collection_id}~{pim_model_asset_id}~{pim_snapshot_id}'
-        return _make_url_safe_base64_encoded_string(fusion_data_component_version_id)
+        asset_prefix = collection_id_prefix + pim_model_asset_id
+        fusion_data_component_id = asset_prefix + '~~'
+        fusion_data_component_version_id = asset_prefix + '~' + pim_snapshot_id
+        return (
+            _make_url_safe_base64_encoded_string(fusion_data_component_id),
+            _make_url_safe_base64_encoded_string(fusion_data_component_version_id),
+        )
 
-    return "Failed to get ID"
+    return "Failed to get ID", "Failed to get ID"
 
 
 # File Cache utilities
@@ -280,21 +381,33 @@ def _make_design_version_file_name(version_id: str) -> str:
     return file_path
 
 
-def _read_versions_file(version_id: str) -> DesignInfo:
+def _read_versions_file(version_id: str) -> Optional[DesignInfo]:
     file_path = _make_design_version_file_name(version_id)
-    if os.path.exists(file_path):
-        with open(file_path, "r") as infile:
-            version_object = json.load(infile)
+    try:
+        with open(file_path, "rb") as infile:
+            version_object = _load_json(infile.read())
             return version_object
+    except FileNotFoundError:
+        return None
 
 
 def _write_results():
-    for design_version_id, design_info in results.items():
-        _write_one_json_object(design_info, design_version_id)
+    for design_version_id in _dirty:
+        _write_one_json_object(results[design_version_id], design_version_id)
+    _dirty.clear()
 
 
 def _write_one_json_object(design_info: DesignInfo, version_id: str):
     file_path = _make_design_version_file_name(version_id)
-    json_string = json.dumps(design_info)
-    with open(file_path, "w") as outfile:
-        outfile.write(json_string)
+    if orjson is not None:
+        with open(file_path, "wb") as outfile:
+            outfile.write(orjson.dumps(design_info))
+    else:
+        with open(file_path, "w") as outfile:
+            json.dump(design_info, outfile)
+
+
+def _load_json(json_data: Union[str, bytes]):
+    if orjson is not None:
+        return orjson.loads(json_data)
+    return json.loads(json_data)